@@ -0,0 +1,351 @@
+"""
+Lightweight gesture models for the EMG-controlled Hue scripts.
+
+The models follow the fit/predict interface that pyomyo's Live_Classifier expects,
+so they can be swapped in for XGBClassifier in hueBright.py and hueColorIMU.py.
+Live_Classifier calls predict() on a single EMG sample at the Myo sample rate
+(~200 Hz), so prediction is kept to a single compiled call.
+
+    Requirements: numpy, numba, scikit-learn, xgboost, pyomyo
+    Optional: treelite, tl2cgen and a C compiler (for CompiledXGBClassifier)
+"""
+
+import hashlib
+import os
+
+import numpy as np
+from numba import config, njit, prange
+from pyomyo.Classifier import Live_Classifier
+from sklearn.linear_model import LogisticRegression
+from xgboost import XGBClassifier
+
+try:
+    import tl2cgen
+    import treelite
+except ImportError:
+    tl2cgen = None
+
+# Training features are computed in parallel from the Myo worker thread; TBB hangs at exit
+# when first launched off the main thread, so prefer the other threading layers
+config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+TOOLCHAIN = 'msvc' if os.name == 'nt' else 'gcc'
+LIB_EXT = '.dll' if os.name == 'nt' else '.so'
+WINDOW_LEN = 10  # EMG samples per feature window (~50 ms at 200 Hz)
+RETRAIN_EVERY = 16  # Newly labelled samples between refits while recording gestures
+
+
+@njit(cache=True, fastmath=True)
+def _predict_linear(X, w, b):
+    """Return 1 for each row of X where X @ w + b > 0, else 0."""
+    out = np.empty(X.shape[0], np.int64)
+    for i in range(X.shape[0]):
+        score = b
+        for j in range(X.shape[1]):
+            score += X[i, j] * w[j]
+        out[i] = 1 if score > 0 else 0
+    return out
+
+
+@njit(cache=True)
+def _quantize_int8(X, inv_scale, out):
+    """Quantize each column of X to int8 with its own scale (X / scale, clipped to +-127)."""
+    for i in range(X.shape[0]):
+        for j in range(X.shape[1]):
+            q = round(X[i, j] * inv_scale[j])
+            out[i, j] = min(max(q, -127), 127)
+
+
+@njit(cache=True)
+def _predict_int8(Xq, wq, w_scale, b):
+    """Return 1 for each row where the int8 dot product Xq @ wq, rescaled, plus b > 0."""
+    out = np.empty(Xq.shape[0], np.int64)
+    for i in range(Xq.shape[0]):
+        acc = np.int32(0)
+        for j in range(Xq.shape[1]):
+            acc += np.int32(Xq[i, j]) * np.int32(wq[j])
+        out[i] = 1 if acc * w_scale + b > 0 else 0
+    return out
+
+
+def _int8_scale(values, axis=None):
+    """Symmetric int8 scale so that max |values| maps to 127 (1 where all values are 0)."""
+    scale = np.abs(values).max(axis=axis, initial=0) / 127
+    return np.where(scale == 0, 1, scale)
+
+
+class NumbaLogisticClassifier:
+    """Binary rest (0) / gesture (1) logistic regression with a Numba-compiled predict.
+
+    With quantize=True, inputs are quantized to int8 with per-feature scales learned
+    at fit time and scored against int8 weights, so the inner loop is an int8 dot
+    product with int32 accumulation.
+    """
+
+    def __init__(self, max_iter=1000, quantize=False):
+        self.max_iter = max_iter
+        self.quantize = quantize
+        self.w = None
+        self.b = np.float32(0)
+
+    def fit(self, X, y):
+        """Train with scikit-learn and keep only the weights and bias as float32.
+
+        Only rows labelled 0 or 1 are used; samples recorded under pyomyo's other
+        label keys (2-9) are ignored rather than rejected.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        y = np.asarray(y)
+        keep = np.isin(y, (0, 1))
+        X, y = X[keep], y[keep]
+        classes = np.unique(y)
+
+        if len(classes) < 2:
+            # Only one gesture (or none) recorded so far: always predict it, rest by default
+            self.w = np.zeros(X.shape[1], dtype=np.float32)
+            self.b = np.float32(1 if len(classes) and classes[0] == 1 else -1)
+            self._quantize_weights(X)
+            return self
+
+        # Standardize for a well-conditioned fit, then fold the scaling back into w and b
+        mean = X.mean(axis=0)
+        std = X.std(axis=0)
+        std[std == 0] = 1
+        model = LogisticRegression(max_iter=self.max_iter)
+        model.fit((X - mean) / std, y)
+
+        w = model.coef_[0] / std
+        self.w = w.astype(np.float32)
+        self.b = np.float32(model.intercept_[0] - (w * mean).sum())
+        self._quantize_weights(X)
+        return self
+
+    def _quantize_weights(self, X):
+        """Fold the per-feature input scales into the weights and quantize them to int8."""
+        x_scale = _int8_scale(X, axis=0)
+        self.inv_x_scale = (1 / x_scale).astype(np.float32)
+        w = self.w * x_scale
+        self.w_scale = np.float32(_int8_scale(w))
+        self.wq = np.round(w / self.w_scale).astype(np.int8)
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if not self.quantize:
+            return _predict_linear(X, self.w, self.b)
+        Xq = np.empty(X.shape, dtype=np.int8)
+        _quantize_int8(X, self.inv_x_scale, Xq)
+        return _predict_int8(Xq, self.wq, self.w_scale, self.b)
+
+
+class CompiledXGBClassifier:
+    """Wraps an XGBClassifier and predicts through its booster compiled to a shared library.
+
+    The library (and a fingerprint of the training data it was built from) is cached
+    in data/, so restarting with unchanged training data skips both fitting and compiling.
+    Compilation takes a few seconds, so disable it while training gestures live.
+    """
+
+    def __init__(self, model, libpath='data/gesture' + LIB_EXT, compile_lib=True):
+        self.model = model
+        self.libpath = libpath
+        self.compile_lib = compile_lib and tl2cgen is not None
+        self.predictor = None
+        if compile_lib and tl2cgen is None:
+            print("treelite/tl2cgen not installed, using XGBoost predict")
+
+    def fit(self, X, y):
+        self.predictor = None
+        if not self.compile_lib:
+            self.model.fit(X, y)
+            return self
+
+        digest = self._fingerprint(X, y)
+        digest_path = self.libpath + '.sha256'
+        if os.path.exists(self.libpath) and os.path.exists(digest_path):
+            with open(digest_path) as f:
+                if f.read() == digest:
+                    self.predictor = tl2cgen.Predictor(self.libpath)
+                    return self
+
+        self.model.fit(X, y)
+        tl_model = treelite.frontend.from_xgboost(self.model.get_booster())
+        tl2cgen.export_lib(tl_model, toolchain=TOOLCHAIN, libpath=self.libpath, params={'parallel_comp': 8})
+        with open(digest_path, 'w') as f:
+            f.write(digest)
+        self.predictor = tl2cgen.Predictor(self.libpath)
+        return self
+
+    def predict(self, X):
+        if self.predictor is None:
+            return self.model.predict(X)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        prob = self.predictor.predict(tl2cgen.DMatrix(X))
+        return (prob.reshape(X.shape[0]) > 0.5).astype(np.int64)
+
+    def _fingerprint(self, X, y):
+        """Hash of the training data, model parameters and compiler versions the cached library was built from."""
+        h = hashlib.sha256()
+        h.update(f"{treelite.__version__} {tl2cgen.__version__} {TOOLCHAIN}".encode())
+        h.update(np.ascontiguousarray(X, dtype=np.float32).tobytes())
+        h.update(np.ascontiguousarray(y, dtype=np.float32).tobytes())
+        h.update(repr(sorted(self.model.get_params().items())).encode())
+        return h.hexdigest()
+
+
+N_FEATURES = 4  # Features per channel: MAV, RMS, waveform length, zero crossings
+
+
+@njit(cache=True, fastmath=True)
+def _emg_features(buf, first, n, out):
+    """Write MAV, RMS, waveform length and zero crossings for each channel into out.
+
+    The window is the n samples buf[(first + k) % len(buf)], so a ring buffer can be
+    passed without reordering. Preprocessed Myo EMG is rectified, so zero crossings
+    are counted around the window mean.
+    """
+    rows = buf.shape[0]
+    channels = buf.shape[1]
+    for c in range(channels):
+        total = 0.0
+        squares = 0.0
+        for k in range(n):
+            v = float(buf[(first + k) % rows, c])
+            total += abs(v)
+            squares += v * v
+        mean = total / n
+        length = 0.0
+        crossings = 0
+        prev = float(buf[first % rows, c])
+        for k in range(1, n):
+            v = float(buf[(first + k) % rows, c])
+            length += abs(v - prev)
+            if (v - mean) * (prev - mean) < 0:
+                crossings += 1
+            prev = v
+        out[c] = mean
+        out[channels + c] = np.sqrt(squares / n)
+        out[2 * channels + c] = length
+        out[3 * channels + c] = crossings
+
+
+@njit(cache=True, parallel=True)
+def _training_features(X, starts, out):
+    for i in prange(X.shape[0]):
+        _emg_features(X, starts[i], i + 1 - starts[i], out[i])
+
+
+class EMGWindow:
+    """Preallocated ring buffer holding the most recent EMG samples, one row per sample."""
+
+    def __init__(self, window_len=WINDOW_LEN, channels=8):
+        # uint16 matches the stored training data (data/vals*.dat)
+        self.ring = np.zeros((window_len, channels), dtype=np.uint16)
+        self.idx = 0  # Samples pushed so far; the next one goes to idx % window_len
+
+    def push(self, emg):
+        self.ring[self.idx % len(self.ring)] = emg
+        self.idx += 1
+
+    def features(self, out):
+        """Write the window features of the buffered samples, oldest first, into out."""
+        window_len = len(self.ring)
+        if self.idx < window_len:
+            _emg_features(self.ring, 0, self.idx, out)
+        else:
+            _emg_features(self.ring, self.idx % window_len, window_len, out)
+
+
+def window_starts(y, window_len):
+    """Start row of each sample's trailing window, never crossing a change of label."""
+    rows = np.arange(len(y))
+    label_change = np.r_[True, y[1:] != y[:-1]]
+    run_start = np.maximum.accumulate(np.where(label_change, rows, 0))
+    return np.maximum(run_start, rows - window_len + 1)
+
+
+def window_features(X, y, window_len=WINDOW_LEN):
+    """EMG features (see _emg_features) over each sample's trailing training window."""
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    out = np.empty((X.shape[0], N_FEATURES * X.shape[1]), dtype=np.float32)
+    _training_features(X, window_starts(np.asarray(y), window_len), out)
+    return out
+
+
+class WindowFeatureModel:
+    """Wraps a fit/predict model so it classifies window features instead of single samples.
+
+    Training windows are cut from consecutive samples with the same label, so each
+    recorded gesture is treated as one continuous recording. At run time the window
+    is the EMGWindow of the most recent live samples.
+    """
+
+    def __init__(self, model, window_len=WINDOW_LEN):
+        self.model = model
+        self.window_len = window_len
+        self.window = EMGWindow(window_len)
+
+    def fit(self, X, y):
+        self.model.fit(window_features(X, y, self.window_len), y)
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X)
+        features = np.empty((X.shape[0], N_FEATURES * X.shape[1]), dtype=np.float32)
+        for i in range(X.shape[0]):
+            self.window.push(X[i])
+            self.window.features(features[i])
+        return self.model.predict(features)
+
+
+class BatchedLiveClassifier(Live_Classifier):
+    """Live_Classifier that refits only once RETRAIN_EVERY new labelled samples have arrived.
+
+    pyomyo retrains from scratch on every sample recorded in training mode; this keeps
+    all the data but batches the fits, so recording is not stalled by training.
+    """
+
+    def __init__(self, classifier, retrain_every=RETRAIN_EVERY, **kwargs):
+        self.retrain_every = retrain_every
+        self.fitted_samples = None  # Training set size at the last fit
+        Live_Classifier.__init__(self, classifier, **kwargs)
+
+    def train(self, X, Y):
+        self.X = X
+        self.Y = Y
+
+        n = self.X.shape[0]
+        if n == 0:
+            # Data erased: fit again as soon as new samples arrive
+            self.fitted_samples = None
+            return
+        if self.fitted_samples is None or abs(n - self.fitted_samples) >= self.retrain_every:
+            self.model.fit(self.X, self.Y)
+            self.fitted_samples = n
+
+
+def make_gesture_classifier(name, color, use_xgb=False, quantize=False, training=False):
+    """Build the Live_Classifier shared by the Hue scripts.
+
+    Uses the Numba logistic model (int8-quantized if quantize), or XGBoost if use_xgb,
+    on window features of the last few EMG samples, refit every RETRAIN_EVERY samples.
+    """
+    if use_xgb:
+        # Compiled to native code with Treelite in control mode (refit every RETRAIN_EVERY samples while training)
+        model = CompiledXGBClassifier(
+            # hist trees, no eval metric (there is no eval set) and one thread keep refits cheap
+            XGBClassifier(
+                tree_method='hist',
+                objective='binary:logistic',
+                base_score=0.5,
+                random_state=42,
+                n_estimators=50,
+                max_depth=4,
+                verbosity=0,
+                n_jobs=1
+            ),
+            compile_lib=not training
+        )
+    else:
+        model = NumbaLogisticClassifier(quantize=quantize)
+    # Classify features of the last few EMG samples rather than each sample alone
+    return BatchedLiveClassifier(WindowFeatureModel(model), name=name, color=color)
@@ -14,8 +14,8 @@ SETUP
     - Make sure Myo armband port is facing hand and the Myo light is showing on the top of your arm 
         - See pyomyo library for more details: https://github.com/PerlinWarp/pyomyo
     
-    Requirements: pyomyo, phue, xgboost, pygame
-    - Install the required packages: `pip install phue pyomyo xgboost pygame` or `pip install -r requirements.txt`.
+    Requirements: pyomyo, phue, xgboost, pygame, numba, scikit-learn
+    - Install the required packages: `pip install phue pyomyo xgboost pygame numba scikit-learn` or `pip install -r requirements.txt`.
 
 
 Training mode allows you to train gestures, while control mode operates the lights. 
@@ -32,15 +32,21 @@ Light control options:
     - Change GROUP_NAME to your Hue group name or LIGHT_NAMES for individual lights (case-sensitive).
     - Set USE_GROUP to True for groups, False for individual lights.
     - Comment and uncomment the appropriate sections for light control.
+    - Set USE_EVENT_STREAM to False on older (v1, round) bridges without the Hue API v2 event stream.
 """
 
-from phue import Bridge
 from pyomyo import emg_mode
-from pyomyo.Classifier import Live_Classifier, MyoClassifier, EMGHandler
-from xgboost import XGBClassifier
-import pygame
-from pygame.locals import *
+from pyomyo.Classifier import MyoClassifier, EMGHandler
+from gestureModels import make_gesture_classifier
+from hueCommon import KeepAliveBridge, bridge_worker, run_myo, send_command
+from functools import partial
+import http.client
+import json
 import os
+import queue
+import ssl
+import threading
+import time
 
 # Configuration
 TRAINING_MODE = False # Set to True to enable training EMG mode; set to False for control mode
@@ -53,64 +59,139 @@ os.makedirs('data', exist_ok=True) # Ensure the 'data' directory exists for stor
 GROUP_NAME = 'Living room'                 # For Hue groups, replace with your group name (Case-sensitive)
 USE_GROUP = True                         # True for groups, False for individual lights
 
+# Bridge state updates
+USE_EVENT_STREAM = True   # Keep the cached on/off state in sync via the Hue API v2 event stream (bridge v2 only)
+EVENT_RETRY_INTERVAL = 5  # Seconds to wait before reconnecting a dropped event stream
+EVENT_READ_TIMEOUT = 120  # Seconds without any data (the bridge sends periodic keep-alives) before reconnecting
+
+# Main loop
+IDLE_SLEEP = 0.001  # Seconds to sleep when no Myo data is waiting, instead of blocking in a read
+
+# Gesture classifier
+USE_XGB = False  # True to classify with XGBoost instead of the lighter Numba logistic model
+QUANTIZE_MODEL = False  # True to score the logistic model with int8 features and weights
+
+# Training GUI
+GUI_FPS = 60  # Training window refresh rate (independent of the ~200 Hz EMG sample rate)
+
 
 def setup_hue_bridge():
-    """Initialize Hue Bridge connection and display available devices."""
+    """Initialize Hue Bridge connection, display available devices and cache the target lights.
+
+    Returns (bridge, target, lights_on): target is the group id (groups) or a dict of
+    light name -> light id (lights), and lights_on is the last-known on/off state,
+    so toggling does not need to read the bridge first.
+    """
     try:
-        bridge = Bridge(BRIDGE_IP)
+        bridge = KeepAliveBridge(BRIDGE_IP)
         bridge.connect()
         
         if USE_GROUP:
             groups = bridge.get_group()
             available = [g['name'] for g in groups.values()]
             print(f"Connected to Hue Bridge. Available groups: {available}")
+            
+            # Keep the first group per name: rooms, zones and entertainment areas can share one
+            name_to_gid = {}
+            for gid, g in groups.items():
+                name_to_gid.setdefault(g['name'], gid)
+            group_id = name_to_gid.get(GROUP_NAME)
+            if group_id is None:
+                print(f"Group '{GROUP_NAME}' not found")
+                return bridge, None, False
+            return bridge, int(group_id), groups[group_id]['state']['any_on']
         else:
-            lights = bridge.get_light_objects('name')
-            available = list(lights.keys())
+            lights = bridge.get_light()
+            available = [l['name'] for l in lights.values()]
             print(f"Connected to Hue Bridge. Available lights: {available}")
             
-        return bridge
+            light_ids = {l['name']: int(lid) for lid, l in lights.items() if l['name'] in LIGHT_NAMES}
+            if not light_ids:
+                print("No specified lights found")
+                return bridge, None, False
+            first_light = lights[str(next(iter(light_ids.values())))]
+            return bridge, light_ids, first_light['state']['on']
+            
     except Exception as e:
         print(f"[ERROR] Could not connect to Hue Bridge: {e}")
-        return None
+        return None, None, False
 
 
-def toggle_lights(bridge):
-    """Toggle lights or group on/off based on current state."""
-    if not bridge:
-        return
+class HueController:
+    """Cached Hue target and on/off state, registered as the Myo pose handler."""
+    
+    __slots__ = ('bridge', 'target', 'lights_on', 'commands')
+    
+    def __init__(self, bridge, target, lights_on):
+        self.bridge = bridge
+        self.target = target
+        self.lights_on = lights_on  # Last-known on/off state of the target
+        self.commands = queue.Queue(maxsize=1)  # Latest pending bridge write, drained by bridge_worker()
+    
+    def toggle_lights(self):
+        """Toggle lights or group on/off based on the cached state."""
+        if not self.bridge or not self.target:
+            return
         
-    try:
-        if USE_GROUP:
-            groups = bridge.get_group()
-            group_id = next((gid for gid, g in groups.items() if g['name'] == GROUP_NAME), None)
-            
-            if group_id:
-                current_state = groups[group_id]['state']['any_on']
-                bridge.set_group(int(group_id), 'on', not current_state)
-                print(f"Group '{GROUP_NAME}' {'OFF' if current_state else 'ON'}")
-            else:
-                print(f"Group '{GROUP_NAME}' not found")
-        else:
-            lights = bridge.get_light_objects('name')
-            available_lights = [name for name in LIGHT_NAMES if name in lights]
-            
-            if available_lights:
-                current_state = lights[available_lights[0]].on
-                for name in available_lights:
-                    lights[name].on = not current_state
-                print(f"Lights {available_lights} {'OFF' if current_state else 'ON'}")
+        self.lights_on = not self.lights_on
+        send_command(self.commands, partial(self.write_on, self.lights_on))
+    
+    def write_on(self, new_state):
+        """Send the on/off state to the bridge (runs on the bridge worker thread)."""
+        try:
+            if USE_GROUP:
+                self.bridge.set_group(self.target, 'on', new_state)
+                print(f"Group '{GROUP_NAME}' {'ON' if new_state else 'OFF'}")
             else:
-                print("No specified lights found")
-                
-    except Exception as e:
-        print(f"Error toggling lights: {e}")
+                # phue sends one PUT per light id; cached ids and state mean no per-light GETs first
+                self.bridge.set_light(list(self.target.values()), 'on', new_state)
+                print(f"Lights {list(self.target)} {'ON' if new_state else 'OFF'}")
+                    
+        except Exception as e:
+            print(f"Error toggling lights: {e}")
+            if self.lights_on == new_state:
+                # The write did not happen: restore the cached state unless a newer toggle replaced it
+                self.lights_on = not new_state
+    
+    def on_pose(self, pose):
+        """Process detected EMG gestures."""
+        if pose == 1 and not TRAINING_MODE:
+            self.toggle_lights()
 
 
-def handle_gesture(pose, bridge):
-    """Process detected EMG gestures."""
-    if pose == 1 and not TRAINING_MODE:
-        toggle_lights(bridge)
+def watch_bridge_events(controller):
+    """Update the cached on/off state from Hue API v2 push events (e.g. changes made in the Hue app)."""
+    if USE_GROUP:
+        resource_v1 = f"/groups/{controller.target}"
+    else:
+        resource_v1 = f"/lights/{next(iter(controller.target.values()))}"
+    
+    # The bridge serves the v2 API over HTTPS with a self-signed certificate
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    headers = {'hue-application-key': controller.bridge.username, 'Accept': 'text/event-stream'}
+    
+    while True:
+        try:
+            connection = http.client.HTTPSConnection(BRIDGE_IP, timeout=EVENT_READ_TIMEOUT, context=context)
+            connection.request('GET', '/eventstream/clip/v2', headers=headers)
+            response = connection.getresponse()
+            if response.status != 200:
+                print(f"Bridge event stream unavailable (HTTP {response.status}), using cached state only")
+                return
+            
+            for line in response:
+                if not line.startswith(b'data:'):
+                    continue
+                for event in json.loads(line[5:]):
+                    for resource in event.get('data', []):
+                        if resource.get('id_v1') == resource_v1 and 'on' in resource:
+                            controller.lights_on = resource['on']['on']
+                            
+        except Exception as e:
+            print(f"Bridge event stream error: {e}")
+        time.sleep(EVENT_RETRY_INTERVAL)
 
 
 def main():
@@ -119,48 +200,40 @@ def main():
     os.makedirs('data', exist_ok=True)
     
     # Initialize Hue Bridge
-    bridge = setup_hue_bridge()
+    controller = HueController(*setup_hue_bridge())
+    threading.Thread(target=bridge_worker, args=(controller.commands,), daemon=True).start()
+    if USE_EVENT_STREAM and controller.bridge and controller.target:
+        threading.Thread(target=watch_bridge_events, args=(controller,), daemon=True).start()
     
-    # Setup training interface if needed
     if TRAINING_MODE:
         print("TRAINING MODE: Press 0 (rest) and 1 (fist) to train gestures")
-        pygame.init()
-        screen = pygame.display.set_mode((800, 320))
-        font = pygame.font.Font(None, 30)
-        pygame.display.set_caption("EMG Light Control - Training")
     else:
-        target = f"group '{GROUP_NAME}'" if USE_GROUP else f"lights {LIGHT_NAMES}"
-        print(f"CONTROL MODE: Make a fist to toggle {target}")
+        target_label = f"group '{GROUP_NAME}'" if USE_GROUP else f"lights {LIGHT_NAMES}"
+        print(f"CONTROL MODE: Make a fist to toggle {target_label}")
     
     # Initialize EMG classifier
-    model = XGBClassifier(eval_metric='logloss', base_score=0.5, objective='binary:logistic')
-    classifier = Live_Classifier(model, name="LightToggle", color=(50, 150, 255))
+    classifier = make_gesture_classifier("LightToggle", (50, 150, 255), USE_XGB, QUANTIZE_MODEL, TRAINING_MODE)
     myo = MyoClassifier(classifier, mode=emg_mode.PREPROCESSED, hist_len=10)
     
     # Setup training handler if in training mode
+    emg_handler = None
     if TRAINING_MODE:
         emg_handler = EMGHandler(myo)
         myo.add_emg_handler(emg_handler)
     
-    # Add gesture handler
-    myo.add_raw_pose_handler(lambda pose: handle_gesture(pose, bridge))
+    # Add gesture handler (bound method, so no per-sample closure)
+    myo.add_raw_pose_handler(controller.on_pose)
     
     try:
         myo.connect()
         print("Connected to Myo armband")
         
-        # Main loop
-        while True:
-            myo.run()
-            if TRAINING_MODE:
-                myo.run_gui(emg_handler, screen, font, 800, 320)
+        run_myo(myo, emg_handler, 'EMG Light Control - Training', GUI_FPS, IDLE_SLEEP)
                 
     except KeyboardInterrupt:
         print("\nStopping...")
     finally:
         myo.disconnect()
-        if TRAINING_MODE:
-            pygame.quit()
         print("Disconnected")
 
 
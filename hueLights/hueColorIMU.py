@@ -14,8 +14,8 @@ SETUP:
     - Ensure Myo dongle is connected and armband is on.
     - Position Myo with port facing hand, light facing towards the ceiling (on top of arm).
 
-    Requirements: pyomyo, phue, xgboost, pygame
-    Install: pip install pyomyo phue xgboost pygame
+    Requirements: pyomyo, phue, xgboost, pygame, numba, scikit-learn
+    Install: pip install pyomyo phue xgboost pygame numba scikit-learn
 
 USAGE:
     - Set TRAINING_MODE = True to train gesture recognition
@@ -24,13 +24,16 @@ USAGE:
     - In control: Hold gesture + move arm left/right to adjust color/hue
 """
 
-from phue import Bridge
 from pyomyo import emg_mode
-from pyomyo.Classifier import Live_Classifier, MyoClassifier, EMGHandler
-from xgboost import XGBClassifier
-import pygame
+from pyomyo.Classifier import MyoClassifier, EMGHandler
+from gestureModels import make_gesture_classifier
+from hueCommon import KeepAliveBridge, bridge_worker, run_myo, send_command
+from numba import njit
+import threading
 import time
 import os
+import queue
+from functools import partial
 
 # === CONFIGURATION ===
 TRAINING_MODE = False  # True for training, False for control
@@ -40,136 +43,190 @@ BRIDGE_IP = '192.168.1.89'  # Replace with your Hue Bridge IP
 # LIGHT_NAMES = ['Back Right', 'Back Left']  # For individual lights, replace with your light names
 GROUP_NAME = 'Living room'                 # For Hue groups, replace with your group name (Case-sensitive)
 USE_GROUP = True                         # True for groups, False for individual lights
+USE_XGB = False  # True to classify with XGBoost instead of the lighter Numba logistic model
+QUANTIZE_MODEL = False  # True to score the logistic model with int8 features and weights
 
 # Control parameters
-UPDATE_INTERVAL = 0.3  # Seconds between hue updates (slower, more gradual changes)
-MOTION_THRESHOLD = 150  # Minimum IMU change to trigger hue adjustment (more sensitive)
+UPDATE_INTERVAL_NS = 300_000_000  # Nanoseconds over which one hue change is applied (longer = slower, more gradual ramp)
+FLUSH_INTERVAL_NS = 100_000_000  # Nanoseconds between batched hue writes to the bridge (the only bridge rate limit)
+TRANSITION_TIME = 1  # Bridge-side fade for each hue write, in deciseconds (one flush interval, smooths steps between flushes)
+MOTION_THRESHOLD = 150  # Minimum IMU change to trigger hue adjustment; smaller movements are ignored as jitter
 HUE_STEP = 500  # Hue change per motion unit (smaller steps for gradual changes)
-DEADZONE = 50  # IMU deadzone to prevent jitter (smaller for more responsiveness)
-
-# Global variables
-current_gesture = 0
-imu_y_value = 0
-last_hue_update = 0
-gesture_start_y = 0  # Track starting Y position when gesture begins
+IMU_SMOOTHING = 0.2  # EWMA weight of each new IMU sample (~1.5 Hz low-pass at the ~50 Hz IMU rate)
+IDLE_SLEEP = 0.001  # Seconds to sleep when no Myo data is waiting, instead of blocking in a read
+GUI_FPS = 60  # Training window refresh rate (independent of the ~200 Hz EMG sample rate)
 
 # === INITIALIZATION ===
 def setup_hue_bridge():
-    """Initialize Hue Bridge connection and display available devices."""
+    """Initialize Hue Bridge connection, display available devices and cache the target lights.
+
+    Returns (bridge, target, hue): target is the group id (groups) or a dict of
+    light name -> light id (lights), and hue is the last-known hue, so adjusting
+    does not need to read the bridge first.
+    """
     try:
-        bridge = Bridge(BRIDGE_IP)
+        bridge = KeepAliveBridge(BRIDGE_IP)
         bridge.connect()
         
         if USE_GROUP:
             groups = bridge.get_group()
             available = [g['name'] for g in groups.values()]
             print(f"Connected to Hue Bridge. Available groups: {available}")
+            
+            # Keep the first group per name: rooms, zones and entertainment areas can share one
+            name_to_gid = {}
+            for gid, g in groups.items():
+                name_to_gid.setdefault(g['name'], gid)
+            group_id = name_to_gid.get(GROUP_NAME)
+            if group_id is None:
+                print(f"Group '{GROUP_NAME}' not found")
+                return bridge, None, 0
+            return bridge, int(group_id), groups[group_id]['action'].get('hue', 0)
         else:
-            lights = bridge.get_light_objects('name')
-            available = list(lights.keys())
+            lights = bridge.get_light()
+            available = [l['name'] for l in lights.values()]
             print(f"Connected to Hue Bridge. Available lights: {available}")
             
-        return bridge
+            light_ids = {l['name']: int(lid) for lid, l in lights.items() if l['name'] in LIGHT_NAMES}
+            if not light_ids:
+                print("No specified lights found")
+                return bridge, None, 0
+            # Get current hue from first light (assume all lights have same hue)
+            first_light = lights[str(next(iter(light_ids.values())))]
+            return bridge, light_ids, first_light['state'].get('hue', 0)
+            
     except Exception as e:
         print(f"[ERROR] Could not connect to Hue Bridge: {e}")
-        return None
+        return None, None, 0
 
 
-def adjust_hue(bridge, hue_change):
-    """Adjust hue value for lights or group based on IMU movement."""
-    if not bridge:
-        return False
-        
-    try:
-        if USE_GROUP:
-            groups = bridge.get_group()
-            group_id = next((gid for gid, g in groups.items() if g['name'] == GROUP_NAME), None)
-            
-            if group_id:
-                # Get current hue
-                current_state = groups[group_id]['action']
-                current_hue = current_state.get('hue', 0)
-                
-                # Calculate new hue (wrap around at 65535)
-                new_hue = (current_hue + hue_change) % 65536
-                new_hue = max(0, min(65535, new_hue))
-                
-                # Update group hue
-                bridge.set_group(int(group_id), 'hue', new_hue)
-                print(f"Group '{GROUP_NAME}' hue: {current_hue} -> {new_hue}")
-                return True
-            else:
-                print(f"Group '{GROUP_NAME}' not found")
-                return False
-        else:
-            lights = bridge.get_light_objects('name')
-            available_lights = [name for name in LIGHT_NAMES if name in lights]
-            
-            if available_lights:
-                # Get current hue from first light (assume all lights have same hue)
-                current_hue = lights[available_lights[0]].hue
-                
-                # Calculate new hue (wrap around at 65535)
-                new_hue = (current_hue + hue_change) % 65536
-                new_hue = max(0, min(65535, new_hue))
-                
-                # Update all specified lights
-                for name in available_lights:
-                    lights[name].hue = new_hue
-                print(f"Lights {available_lights} hue: {current_hue} -> {new_hue}")
-                return True
-            else:
-                print("No specified lights found")
-                return False
-                
-    except Exception as e:
-        print(f"Error adjusting hue: {e}")
-        return False
-
-
-def handle_gesture(pose, bridge):
-    """Process detected EMG gestures."""
-    global current_gesture, gesture_start_y, imu_y_value
-    if pose != current_gesture:
-        current_gesture = pose
-        if pose == 1:
-            # Capture starting position when gesture begins
-            gesture_start_y = imu_y_value
-            print(f"Gesture active - hue control enabled (starting Y: {gesture_start_y:.1f})")
-        else:
-            print("Gesture inactive - hue control disabled")
+@njit(cache=True)
+def motion_to_hue_change(relative_y):
+    """Map relative IMU movement to a hue change per UPDATE_INTERVAL_NS, 0 up to MOTION_THRESHOLD (branch-free)."""
+    active = abs(relative_y) > MOTION_THRESHOLD
+    return int((relative_y / MOTION_THRESHOLD) * HUE_STEP) * active
 
 
-def handle_imu(quat, acc, gyro, bridge):
-    """Process IMU data for motion detection."""
-    global imu_y_value, last_hue_update, current_gesture, gesture_start_y
+class HueController:
+    """Gesture/IMU state and the cached Hue target, registered as the Myo pose and IMU handlers."""
     
-    # Always update current IMU value
-    imu_y_value = acc[1]
+    __slots__ = ('bridge', 'target', 'hue', 'hue_synced', 'current_gesture', 'imu_y_value', 'gesture_start_y',
+                 'last_imu_time', 'pending_hue_delta', 'last_hue_flush', 'commands')
     
-    # Only process IMU when gesture is active and not in training mode
-    if current_gesture != 1 or TRAINING_MODE:
-        return
+    def __init__(self, bridge, target, hue):
+        self.bridge = bridge
+        self.target = target
+        self.hue = hue  # Last hue written to (or read from) the bridge
+        self.hue_synced = True  # False while refresh_hue() is pending; flush_hue() waits for it
+        self.current_gesture = 0
+        self.imu_y_value = None  # Low-pass filtered IMU y-axis (None until the first IMU sample)
+        self.gesture_start_y = 0  # Track starting Y position when gesture begins
+        self.last_imu_time = 0
+        self.pending_hue_delta = 0.0  # Hue change accumulated since the last flush (fractions carry over)
+        self.last_hue_flush = 0
+        self.commands = queue.Queue(maxsize=1)  # Latest pending bridge write, drained by bridge_worker()
     
-    # Calculate relative movement from starting position
-    relative_y = imu_y_value - gesture_start_y
+    def adjust_hue(self, hue_change):
+        """Adjust hue value for lights or group based on IMU movement."""
+        if not self.bridge or not self.target:
+            return False
+        
+        current_hue = self.hue
+        
+        # Calculate new hue (wrap around at 65535)
+        new_hue = (current_hue + hue_change) % 65536
+        new_hue = max(0, min(65535, new_hue))
+        
+        self.hue = new_hue
+        send_command(self.commands, partial(self.write_hue, current_hue, new_hue))
+        return True
     
-    # Rate limiting for bridge protection
-    current_time = time.time()
-    if current_time - last_hue_update < UPDATE_INTERVAL:
-        return
+    def write_hue(self, current_hue, new_hue):
+        """Send the new hue to the bridge (runs on the bridge worker thread)."""
+        try:
+            # All attributes go in one payload, so each target gets a single PUT
+            payload = {'hue': new_hue, 'transitiontime': TRANSITION_TIME}
+            if USE_GROUP:
+                # Update group hue
+                self.bridge.set_group(self.target, payload)
+                print(f"Group '{GROUP_NAME}' hue: {current_hue} -> {new_hue}")
+            else:
+                # Update all specified lights by id
+                self.bridge.set_light(list(self.target.values()), payload)
+                print(f"Lights {list(self.target)} hue: {current_hue} -> {new_hue}")
+                    
+        except Exception as e:
+            print(f"Error adjusting hue: {e}")
     
-    # Apply deadzone to prevent jitter
-    if abs(relative_y) < DEADZONE:
-        return
+    def refresh_hue(self):
+        """Re-read the hue from the bridge (runs on the bridge worker thread), so changes made in the Hue app are kept."""
+        try:
+            if USE_GROUP:
+                self.hue = self.bridge.get_group(self.target)['action'].get('hue', self.hue)
+            else:
+                first_light = next(iter(self.target.values()))
+                self.hue = self.bridge.get_light(first_light)['state'].get('hue', self.hue)
+        except Exception as e:
+            print(f"Error reading hue: {e}")
+        finally:
+            # Set after self.hue, so flush_hue() never builds a write on the stale hue
+            self.hue_synced = True
+    
+    def on_pose(self, pose):
+        """Process detected EMG gestures."""
+        if pose == 1 and self.imu_y_value is None:
+            return  # No IMU sample yet to measure movement from; start on a later pose sample
+        if pose != self.current_gesture:
+            self.current_gesture = pose
+            if pose == 1:
+                # Capture starting position when gesture begins
+                self.gesture_start_y = self.imu_y_value
+                if self.bridge and self.target:
+                    # Resync the cached hue before the first adjustment (read off the sample loop).
+                    # Hue writes are held back until it finishes, so none can replace it in the queue.
+                    self.hue_synced = False
+                    send_command(self.commands, self.refresh_hue)
+                print(f"Gesture active - hue control enabled (starting Y: {self.gesture_start_y:.1f})")
+            else:
+                print("Gesture inactive - hue control disabled")
+    
+    def on_imu(self, quat, acc, gyro):
+        """Process IMU data for motion detection; hue changes are accumulated for flush_hue()."""
+        current_time = time.monotonic_ns()
+        # Time covered by this sample (capped, so a gap in the IMU stream cannot cause a jump)
+        elapsed = min(current_time - self.last_imu_time, UPDATE_INTERVAL_NS)
+        self.last_imu_time = current_time
+        
+        # Always update current IMU value, smoothed to suppress sensor jitter
+        if self.imu_y_value is None:
+            # Seed with the first reading so the filter does not ramp up from 0
+            self.imu_y_value = float(acc[1])
+        else:
+            self.imu_y_value += IMU_SMOOTHING * (acc[1] - self.imu_y_value)
+        
+        # Only process IMU when gesture is active and not in training mode
+        if self.current_gesture != 1 or TRAINING_MODE:
+            return
+        
+        # Calculate relative movement from starting position
+        relative_y = self.imu_y_value - self.gesture_start_y
+        
+        # Calculate hue change based on relative IMU movement (threshold applied), spread over
+        # the IMU samples so the hue ramps continuously at one change per UPDATE_INTERVAL_NS
+        self.pending_hue_delta += motion_to_hue_change(relative_y) * elapsed / UPDATE_INTERVAL_NS
     
-    # Calculate hue change based on relative IMU movement
-    if abs(relative_y) > MOTION_THRESHOLD:
-        hue_change = int((relative_y / MOTION_THRESHOLD) * HUE_STEP)
+    def flush_hue(self):
+        """Send the accumulated hue change to the bridge in a single write, at most every FLUSH_INTERVAL_NS."""
+        current_time = time.monotonic_ns()
+        hue_change = int(self.pending_hue_delta)  # Whole hue units; the fraction waits for the next flush
+        if hue_change == 0 or not self.hue_synced or current_time - self.last_hue_flush < FLUSH_INTERVAL_NS:
+            return  # Changes keep accumulating while the hue resync is in flight
         
-        if adjust_hue(bridge, hue_change):
-            last_hue_update = current_time
-            print(f"Relative Y: {relative_y:.1f} (from {gesture_start_y:.1f}) -> Hue change: {hue_change}")
+        self.pending_hue_delta -= hue_change
+        self.last_hue_flush = current_time
+        relative_y = self.imu_y_value - self.gesture_start_y
+        print(f"Relative Y: {relative_y:.1f} (from {self.gesture_start_y:.1f}) -> Hue change: {hue_change}")
+        self.adjust_hue(hue_change)
 
 
 def main():
@@ -181,29 +238,19 @@ def main():
     os.makedirs('data', exist_ok=True)
     
     # Initialize Hue Bridge
-    bridge = setup_hue_bridge()
+    controller = HueController(*setup_hue_bridge())
+    threading.Thread(target=bridge_worker, args=(controller.commands,), daemon=True).start()
+    motion_to_hue_change(0.0)  # Compile the IMU kernel before samples arrive
     
-    # Setup training interface if needed
     if TRAINING_MODE:
         print("TRAINING MODE: Press 0 (rest) and 1 (fist) to train gestures")
-        pygame.init()
-        screen = pygame.display.set_mode((800, 320))
-        font = pygame.font.Font(None, 30)
-        pygame.display.set_caption("EMG Hue Control - Training")
     else:
-        target = f"group '{GROUP_NAME}'" if USE_GROUP else f"lights {LIGHT_NAMES}"
-        print(f"CONTROL MODE: Hold fist gesture + move arm left/right to adjust hue for {target}")
+        target_label = f"group '{GROUP_NAME}'" if USE_GROUP else f"lights {LIGHT_NAMES}"
+        print(f"CONTROL MODE: Hold fist gesture + move arm left/right to adjust hue for {target_label}")
     
     # Initialize EMG classifier
     try:
-        model = XGBClassifier(
-            eval_metric='logloss',
-            objective='binary:logistic',
-            base_score=0.5,
-            random_state=42,
-            n_estimators=50
-        )
-        classifier = Live_Classifier(model, name="HueIMU", color=(255, 100, 50))
+        classifier = make_gesture_classifier("HueIMU", (255, 100, 50), USE_XGB, QUANTIZE_MODEL, TRAINING_MODE)
         myo = MyoClassifier(classifier, mode=emg_mode.PREPROCESSED, hist_len=10)
         
     except Exception as e:
@@ -212,13 +259,14 @@ def main():
         return
     
     # Setup training handler if in training mode
+    emg_handler = None
     if TRAINING_MODE:
         emg_handler = EMGHandler(myo)
         myo.add_emg_handler(emg_handler)
     
-    # Add gesture and IMU handlers (pass bridge to handlers)
-    myo.add_raw_pose_handler(lambda pose: handle_gesture(pose, bridge))
-    myo.add_imu_handler(lambda quat, acc, gyro: handle_imu(quat, acc, gyro, bridge))
+    # Add gesture and IMU handlers (bound methods, so no per-sample closure or global lookups)
+    myo.add_raw_pose_handler(controller.on_pose)
+    myo.add_imu_handler(controller.on_imu)
     
     # Main execution loop
     try:
@@ -226,10 +274,7 @@ def main():
         print("Connected to Myo armband")
         print("Ready for operation...")
         
-        while True:
-            myo.run()
-            if TRAINING_MODE:
-                myo.run_gui(emg_handler, screen, font, 800, 320)
+        run_myo(myo, emg_handler, 'EMG Hue Control - Training', GUI_FPS, IDLE_SLEEP, poll=controller.flush_hue)
                 
     except KeyboardInterrupt:
         print("\nStopping...")
@@ -237,8 +282,6 @@ def main():
         print(f"Error during execution: {e}")
     finally:
         myo.disconnect()
-        if TRAINING_MODE:
-            pygame.quit()
         print("Disconnected")
 
 
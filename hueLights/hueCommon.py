@@ -0,0 +1,187 @@
+"""
+Shared Hue bridge and training GUI helpers for the EMG-controlled Hue scripts.
+
+Used by hueBright.py and hueColorIMU.py: a keep-alive phue Bridge, the coalescing
+bridge write queue that keeps HTTP off the Myo sample loop, the Myo read loop and
+the training window. pygame has to stay on the main thread (macOS only allows
+windows there), so in training mode the Myo loop runs on a worker thread instead.
+
+    Requirements: phue, pygame
+"""
+
+import http.client
+import json
+import queue
+import threading
+import time
+
+import pygame
+from phue import Bridge
+from pygame.locals import K_0, K_9, K_KP0, K_KP9, KEYDOWN, KEYUP, QUIT
+
+
+class KeepAliveBridge(Bridge):
+    """phue Bridge that reuses one HTTP connection instead of opening a new one per request."""
+
+    def __init__(self, *args, **kwargs):
+        self._connection = None
+        self._connection_lock = threading.Lock()
+        Bridge.__init__(self, *args, **kwargs)
+
+    def request(self, mode='GET', address=None, data=None):
+        body = json.dumps(data) if mode in ('PUT', 'POST') else None
+        with self._connection_lock:
+            # Retry once on a fresh connection if the bridge closed the idle one
+            for attempt in range(2):
+                if self._connection is None:
+                    self._connection = http.client.HTTPConnection(self.ip, timeout=10)
+                try:
+                    self._connection.request(mode, address, body)
+                    response = self._connection.getresponse().read()
+                    return json.loads(response.decode('utf-8'))
+                except (http.client.HTTPException, OSError):
+                    self._connection.close()
+                    self._connection = None
+                    if attempt:
+                        raise
+
+
+def send_command(commands, command):
+    """Queue a bridge write for bridge_worker(), replacing any write it has not picked up yet."""
+    while True:
+        try:
+            commands.put_nowait(command)
+            return
+        except queue.Full:
+            try:
+                commands.get_nowait()
+            except queue.Empty:
+                pass
+
+
+def bridge_worker(commands):
+    """Run queued bridge writes so HTTP never blocks the Myo sample loop."""
+    while True:
+        command = commands.get()
+        command()
+
+
+def emg_loop(myo, myo_lock, stop_event, idle_sleep, poll=None):
+    """Read Myo samples until stop_event is set, calling poll() (if given) once per iteration."""
+    try:
+        while not stop_event.is_set():
+            # Only read when the dongle has data; otherwise yield the CPU (and the lock)
+            if myo.bt.ser.in_waiting:
+                with myo_lock:
+                    myo.run()
+            else:
+                time.sleep(idle_sleep)
+            if poll:
+                poll()
+    finally:
+        stop_event.set()
+
+
+def gui_snapshot(myo):
+    """What the training window displays: top class, prediction votes, samples per label and history length."""
+    votes = tuple(myo.history_cnt[i] for i in range(10))
+    counts = tuple(int((myo.cls.Y == i).sum()) for i in range(10))
+    return myo.history_cnt.most_common(1)[0][0], votes, counts, len(myo.history)
+
+
+def handle_gui_events(myo, emg_handler, myo_lock):
+    """Apply pyomyo's training key bindings; returns True if any event arrived.
+
+    Digit keys label the incoming samples, 'r' reloads and 'e' erases the stored data,
+    and 'q' or closing the window raises KeyboardInterrupt.
+    """
+    events = pygame.event.get()
+    for ev in events:
+        if ev.type == QUIT or (ev.type == KEYDOWN and ev.unicode == 'q'):
+            raise KeyboardInterrupt()
+        elif ev.type == KEYDOWN:
+            if K_0 <= ev.key <= K_9:
+                emg_handler.recording = ev.key - K_0
+            elif K_KP0 <= ev.key <= K_KP9:
+                emg_handler.recording = ev.key - K_KP0
+            elif ev.unicode == 'r':
+                with myo_lock:
+                    myo.cls.read_data()
+            elif ev.unicode == 'e':
+                print("Pressed e, erasing local data")
+                with myo_lock:
+                    myo.cls.delete_data()
+        elif ev.type == KEYUP:
+            if K_0 <= ev.key <= K_9 or K_KP0 <= ev.key <= K_KP9:
+                # Don't record incoming data
+                emg_handler.recording = -1
+    return bool(events)
+
+
+def draw_gui(screen, font, color, snapshot, w, h):
+    """Draw a gui_snapshot() the way pyomyo's run_gui does: samples per label and a vote bar per class."""
+    top, votes, counts, history_len = snapshot
+    screen.fill((0, 0, 0), (0, 0, w, h))
+    for i in range(10):
+        y = 30 * i
+        clr = color if i == top else (255, 255, 255)
+        screen.blit(font.render('%5d' % counts[i], True, (255, 255, 255)), (20, y))
+        txt = font.render('%d' % i, True, clr)
+        screen.blit(txt, (110, y))
+        bar_y = y + txt.get_height() / 2 - 10
+        screen.fill((0, 0, 0), (130, bar_y, history_len * 20, 20))
+        screen.fill(clr, (130, bar_y, votes[i] * 20, 20))
+    pygame.display.flip()
+
+
+def gui_loop(myo, emg_handler, myo_lock, stop_event, caption, fps):
+    """Run the training GUI at fps on the main thread while emg_loop() reads samples on a worker.
+
+    The lock is only held to retrain on 'r'/'e' and to take the snapshot, so the EMG
+    loop never waits for rendering.
+    """
+    pygame.init()
+    screen = pygame.display.set_mode((800, 320))
+    font = pygame.font.Font(None, 30)
+    pygame.display.set_caption(caption)
+    clock = pygame.time.Clock()
+    drawn = None
+
+    try:
+        while not stop_event.is_set():
+            had_events = handle_gui_events(myo, emg_handler, myo_lock)
+            with myo_lock:
+                shown = gui_snapshot(myo)
+            # Redraw only when the shown values changed or there were window events (e.g. expose)
+            if shown != drawn or had_events:
+                draw_gui(screen, font, myo.cls.color, shown, 800, 320)
+                drawn = shown
+            clock.tick(fps)
+    except KeyboardInterrupt:
+        pass  # Window closed or 'q' pressed
+    finally:
+        stop_event.set()
+        pygame.quit()
+
+
+def run_myo(myo, emg_handler, caption, fps, idle_sleep, poll=None):
+    """Read the connected Myo until stopped, with the training GUI if emg_handler is given.
+
+    In training mode pygame stays on the main thread (macOS only allows windows there)
+    and emg_loop() runs on a worker; the lock keeps the GUI's retrains and snapshots
+    from running mid-sample.
+    """
+    myo_lock = threading.Lock()
+    stop_event = threading.Event()
+    emg_args = (myo, myo_lock, stop_event, idle_sleep, poll)
+    if emg_handler is None:
+        emg_loop(*emg_args)
+        return
+
+    emg_thread = threading.Thread(target=emg_loop, args=emg_args, daemon=True)
+    emg_thread.start()
+    try:
+        gui_loop(myo, emg_handler, myo_lock, stop_event, caption, fps)
+    finally:
+        stop_event.set()
+        emg_thread.join()